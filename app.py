@@ -1,13 +1,23 @@
 # app.py
+# eventlet must patch the stdlib before anything else imports socket/threading
+import eventlet
+eventlet.monkey_patch()
+
+from cachetools import TTLCache
+from eventlet.queue import Empty, Queue
 from flask import Flask, render_template, request, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
-from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import event, func, insert, or_, select, true, update
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import logging
 import os
+import queue
+import sqlite3
 import smtplib
 from email.message import EmailMessage
-import traceback
 
 # optional .env loader
 try:
@@ -17,6 +27,10 @@ try:
 except Exception:
     pass
 
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger(__name__)
+
 
 # ------------- Config & App -------------
 app = Flask(__name__)
@@ -28,18 +42,44 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
 )
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# engine tuning: keep compiled statements cached (the scheduler runs the same
+# query every tick) and keep a pool of checked connections around
+engine_options = {
+    'query_cache_size': 1200,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+    'future': True,
+}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # scheduler, mail worker and request green threads share the sqlite pool;
+    # no pool sizing here - in-memory sqlite (StaticPool) and file sqlite on
+    # SQLAlchemy 1.4 (NullPool) reject pool_size / max_overflow
+    engine_options['connect_args'] = {'check_same_thread': False}
+else:
+    engine_options['pool_size'] = 10
+    engine_options['max_overflow'] = 20
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL on sqlite so the scheduler's writes don't block page reads."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 # SocketIO: allow local testing origins; set to specific origin(s) in production
 # socketio = SocketIO(cors_allowed_origins="*")
 
 # db = SQLAlchemy(app)
-# scheduler = BackgroundScheduler()
 # Ensure async worker is available (eventlet recommended for Flask-SocketIO)
 # install with: pip install eventlet
 # then create socketio with the app attached
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
 db = SQLAlchemy(app)
-scheduler = BackgroundScheduler()
 
 # ------------- Email config (env) -------------
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -49,45 +89,191 @@ EMAIL_PASS = os.getenv('EMAIL_PASS', '')         # app password (recommended)
 DEFAULT_FROM = os.getenv('EMAIL_FROM') or EMAIL_USER
 DEFAULT_TO = os.getenv('EMAIL_TO', '')           # fallback recipient
 EMAIL_DEBUG = os.getenv('EMAIL_DEBUG', 'false').lower() in ('1','true','yes')
-
-def send_email(to_address, subject, body):
-    """Send a plain-text email. Returns True on success, False on failure."""
-    if not EMAIL_USER or not EMAIL_PASS:
-        print("[Email] ERROR: EMAIL_USER or EMAIL_PASS not set in environment.")
+# ready, logged-in connections kept around; one per sending worker (there is one)
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '1'))
+SMTP_MAX_PER_CONN = 100          # reconnect after this many messages (provider caps)
+
+def _open_smtp():
+    """Open a connected and authenticated SMTP session (SSL or STARTTLS)."""
+    if EMAIL_PORT == 465:
+        server = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT, timeout=30)
+        if EMAIL_DEBUG:
+            server.set_debuglevel(1)
+    else:
+        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=30)
+        if EMAIL_DEBUG:
+            server.set_debuglevel(1)
+        server.ehlo()
+        if EMAIL_PORT in (587, 25):
+            server.starttls()
+            server.ehlo()
+    server.login(EMAIL_USER, EMAIL_PASS)
+    return server
+
+def _send_via(server, to_address, subject, body):
+    """Build a plain-text message and send it over an already open session."""
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = DEFAULT_FROM or EMAIL_USER
+    msg['To'] = to_address
+    msg.set_content(body)
+    server.send_message(msg)
+
+# outbox ids delivered in the last 10 minutes. If marking a job sent is rolled
+# back, the next batch picks it up again; this stops it being mailed twice.
+_recent_sends = TTLCache(maxsize=4096, ttl=600)
+
+class SMTPSession:
+    """One SMTP connection shared by many sends (pooled, see pooled_smtp).
+
+    Reconnects transparently if the server dropped the connection between
+    messages, and rotates the connection after SMTP_MAX_PER_CONN messages.
+    send() returns True on success, False if this message was refused, and
+    raises OSError / SMTPException if no connection can be (re)established.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.sent = 0                # messages sent on the current connection
+
+    def _connect(self):
+        self.server = _open_smtp()
+        self.sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
         return False
 
-    try:
-        msg = EmailMessage()
-        msg['Subject'] = subject
-        msg['From'] = DEFAULT_FROM or EMAIL_USER
-        msg['To'] = to_address
-        msg.set_content(body)
-
-        # choose SSL vs STARTTLS
-        if EMAIL_PORT == 465:
-            with smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT, timeout=30) as server:
-                if EMAIL_DEBUG:
-                    server.set_debuglevel(1)
-                server.login(EMAIL_USER, EMAIL_PASS)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=30) as server:
-                if EMAIL_DEBUG:
-                    server.set_debuglevel(1)
-                server.ehlo()
-                if EMAIL_PORT in (587, 25):
-                    server.starttls()
-                    server.ehlo()
-                server.login(EMAIL_USER, EMAIL_PASS)
-                server.send_message(msg)
-
-        print(f"[Email] Sent to {to_address}: {subject}")
+    def _ensure(self):
+        if self.server is None:
+            self._connect()
+            return
+        if self.sent >= SMTP_MAX_PER_CONN:
+            self.close()
+            self._connect()
+            return
+        # cheap health check between messages; reconnect if it went away
+        try:
+            self.server.noop()
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.close()
+            self._connect()
+
+    def _deliver(self, to_address, subject, body):
+        try:
+            _send_via(self.server, to_address, subject, body)
+        except smtplib.SMTPServerDisconnected:
+            raise
+        except Exception:
+            log.exception("[Email] Failed to send to %s", to_address)
+            # a failed RCPT/DATA can leave the session in a bad state
+            try:
+                self.server.rset()
+            except Exception:
+                self.close()
+            return False
+        self.sent += 1
+        log.debug("[Email] Sent to %s: %s", to_address, subject)
         return True
 
-    except Exception as e:
-        print("[Email] Failed to send — exception:")
-        traceback.print_exc()
-        return False
+    def send(self, to_address, subject, body):
+        if not EMAIL_USER or not EMAIL_PASS:
+            log.error("[Email] EMAIL_USER or EMAIL_PASS not set in environment.")
+            return False
+        self._ensure()               # connection failures propagate
+        try:
+            return self._deliver(to_address, subject, body)
+        except smtplib.SMTPServerDisconnected:
+            # dropped between the NOOP and DATA: reconnect once
+            self.close()
+            self._connect()
+            try:
+                return self._deliver(to_address, subject, body)
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+# idle, already authenticated sessions so a send doesn't pay TLS + AUTH first
+_smtp_pool = queue.Queue(maxsize=SMTP_POOL_SIZE)
+
+def _acquire_smtp():
+    try:
+        return _smtp_pool.get_nowait()
+    except queue.Empty:
+        return SMTPSession()         # connects lazily on first send
+
+def _release_smtp(session, ok):
+    if ok and session.server is not None:
+        try:
+            _smtp_pool.put_nowait(session)
+            return
+        except queue.Full:
+            pass
+    session.close()
+
+@contextmanager
+def pooled_smtp():
+    """Borrow an SMTPSession from the pool for the duration of the block."""
+    session = _acquire_smtp()
+    ok = False
+    try:
+        yield session
+        ok = True
+    finally:
+        _release_smtp(session, ok)
+
+def _prefill_smtp_pool():
+    """Open SMTP_POOL_SIZE connections up front (done by the mail worker)."""
+    if not EMAIL_USER or not EMAIL_PASS:
+        return
+    for _ in range(SMTP_POOL_SIZE):
+        session = SMTPSession()
+        try:
+            session._connect()
+        except Exception as e:
+            log.warning("[Email] could not pre-open SMTP connection: %s", e)
+            return
+        _release_smtp(session, True)
+
+# Outgoing mail goes through the EmailJob outbox table: callers only insert
+# rows (in the same transaction as whatever caused them) and a background
+# green thread (see _mail_worker) sends them, retrying failures with
+# exponential backoff. Nothing is lost if SMTP is down or the process restarts.
+MAIL_BATCH_SIZE = 50
+MAIL_POLL_SECONDS = 30           # also picks up retries whose backoff expired
+EMAIL_RETRY_BASE = timedelta(seconds=30)
+EMAIL_MAX_ATTEMPTS = 8           # ~2h of backoff, after that the job is left unsent
+# tokens put here wake the worker early, e.g. right after a job is committed
+_mail_wakeup = Queue()
+_mail_worker_started = False
+
+def queue_email(to_address, subject, body, task_id=None, kind=None):
+    """Add an outbox row to the current session; the caller commits."""
+    job = EmailJob(to_address=to_address, subject=subject, body=body,
+                   task_id=task_id, kind=kind)
+    db.session.add(job)
+    return job
+
+def wake_mail_worker():
+    """Tell the worker new jobs were committed (starting it on first use)."""
+    global _mail_worker_started
+    if not _mail_worker_started:
+        # started on first use so it also runs when app.py isn't __main__
+        # (e.g. `flask run`); a green thread under async_mode='eventlet'
+        _mail_worker_started = True
+        socketio.start_background_task(_mail_worker)
+    _mail_wakeup.put(None)
 
 # ------------- Database model -------------
 class Task(db.Model):
@@ -101,8 +287,41 @@ class Task(db.Model):
     notified_1day = db.Column(db.Boolean, default=False)
     notified_1hour = db.Column(db.Boolean, default=False)
 
-    def notify_recipient(self):
-        return self.notify_email or DEFAULT_TO
+class EmailJob(db.Model):
+    """Outbox row for one email; sent_at stays NULL until delivered."""
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.Text, nullable=False)       # holds a task title plus prefix
+    body = db.Column(db.Text, nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=True)
+    kind = db.Column(db.String(10), nullable=True)   # 'day' / 'hour' reminder, None otherwise
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_try_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+# the worker looks for unsent jobs whose next_try_at has passed
+db.Index('ix_email_job_pending', EmailJob.sent_at, EmailJob.next_try_at)
+# at most one reminder of each kind per task, even if its flag gets reset
+# (confirmation mails have NULL task_id/kind and are not constrained)
+db.Index('ux_email_job_task_kind', EmailJob.task_id, EmailJob.kind, unique=True)
+
+# the reminder select and the idle probe filter on status + due_date window
+# with an OR over both flags; with the flags in the index the whole WHERE
+# clause is answered from it (an OR can't use the partial indexes below)
+db.Index('ix_task_pending_due', Task.status, Task.due_date, Task.notified_1day, Task.notified_1hour)
+# _reschedule looks at pending tasks missing one specific reminder; partial
+# indexes keep exactly those rows, so its MINs scale with the unnotified set
+# rather than with all pending tasks. The predicate is only the flag: it
+# compiles to a literal (= 0 / = false), while 'Pending' is sent as a bound
+# parameter, and sqlite only uses a partial index whose WHERE terms appear
+# literally in the query.
+_unnotified_day = Task.notified_1day == False
+_unnotified_hour = Task.notified_1hour == False
+db.Index('ix_task_unnotified_day', Task.status, Task.due_date,
+         postgresql_where=_unnotified_day, sqlite_where=_unnotified_day)
+db.Index('ix_task_unnotified_hour', Task.status, Task.due_date,
+         postgresql_where=_unnotified_hour, sqlite_where=_unnotified_hour)
 
 # ------------- Web routes -------------
 @app.route('/')
@@ -120,99 +339,389 @@ def add_task():
     if not title or not due_raw:
         return "Missing fields", 400
 
+    # datetime-local always sends ISO-8601, so try the fast C parser first
     try:
-        due_date = datetime.strptime(due_raw, '%Y-%m-%dT%H:%M')
-    except Exception:
+        due_date = datetime.fromisoformat(due_raw)
+    except ValueError:
         try:
-            due_date = datetime.fromisoformat(due_raw)
-        except Exception:
+            due_date = datetime.strptime(due_raw, '%Y-%m-%dT%H:%M')
+        except ValueError:
             return "Invalid date format. Use YYYY-MM-DDTHH:MM", 400
 
     task = Task(title=title, description=description, due_date=due_date, notify_email=notify_email)
     db.session.add(task)
-    db.session.commit()
 
     # send immediate confirmation to the provided email (optional)
     if notify_email:
         subject = f"Task received: {title}"
         body = f"Your task '{title}' has been created and is due on {task.due_date}.\nYou will receive reminders 1 day and 1 hour before the deadline."
-        ok = send_email(notify_email, subject, body)
-        print(f"[add_task] confirmation email sent? {ok}")
+        queue_email(notify_email, subject, body)
+
+    db.session.commit()
+    if notify_email:
+        wake_mail_worker()
+    _invalidate_earliest_due()
+    _reschedule()
 
     return redirect(url_for('index'))
 
 # ------------- Scheduler job -------------
+# Earliest due_date among pending tasks that still need a reminder, cached
+# between ticks so idle ticks don't hit the DB at all. _UNKNOWN means "probe
+# again"; None means there is nothing left to remind about.
+_UNKNOWN = object()
+_earliest_due = _UNKNOWN
+
+def _invalidate_earliest_due():
+    global _earliest_due
+    _earliest_due = _UNKNOWN
+
+def _has_recipient():
+    """Filter for tasks a reminder can be sent to (all of them if EMAIL_TO is set)."""
+    return true() if DEFAULT_TO else Task.notify_email.isnot(None)
+
+def _probe_earliest_due(now):
+    """SELECT MIN(due_date) over the tasks check_deadlines could act on."""
+    return db.session.query(func.min(Task.due_date)).filter(
+        Task.status == 'Pending',
+        Task.due_date > now,
+        or_(Task.notified_1day == False, Task.notified_1hour == False),
+        _has_recipient()
+    ).scalar()
+
+# reminder texts, bound .format methods so the loop only fills in fields
+_DAY_SUBJ = "Reminder: '{title}' is due in ~1 day".format
+_HOUR_SUBJ = "Urgent: '{title}' is due in ~1 hour".format
+_REMINDER_BODY = "Task: {title}\nDue: {due}\n\n{desc}".format
+
 def check_deadlines():
     with app.app_context():
-        now = datetime.now()             # naive local
-        day_threshold = now + timedelta(days=1)
-        hour_threshold = now + timedelta(hours=1)
-
-        # 1-day reminders
         try:
-            tasks_day = Task.query.filter(
+            _queue_reminders()
+        finally:
+            _reschedule(after_run=True)
+
+def _queue_reminders():
+    global _earliest_due
+    now = datetime.now()             # naive local
+    day_threshold = now + timedelta(days=1)
+    hour_threshold = now + timedelta(hours=1)
+
+    # fast path: nothing falls inside the 1-day window yet
+    if _earliest_due is _UNKNOWN:
+        try:
+            _earliest_due = _probe_earliest_due(now)
+        except Exception as e:
+            log.error("[check_deadlines] DB probe failed: %s", e)
+            return
+    if _earliest_due is None or _earliest_due > day_threshold:
+        return
+    # there is work in the window; flags will change, so re-probe next time
+    _invalidate_earliest_due()
+
+    # single query for both windows: the 1-hour set is a subset of the 1-day set.
+    # Core select returning plain Rows - nothing enters the identity map.
+    try:
+        rows = db.session.execute(
+            select(
+                Task.id, Task.title, Task.due_date, Task.description,
+                Task.notify_email, Task.notified_1day, Task.notified_1hour
+            ).where(
                 Task.status == 'Pending',
-                Task.due_date <= day_threshold,
                 Task.due_date > now,
-                Task.notified_1day == False
-            ).all()
-        except Exception as e:
-            print("[check_deadlines] DB query (day) failed:", e)
-            tasks_day = []
-
-        for task in tasks_day:
-            recipient = task.notify_recipient()
-            if not recipient:
-                print(f"[check_deadlines] no recipient for task {task.id}, skipping")
-                continue
-            subject = f"Reminder: '{task.title}' is due in ~1 day"
-            body = f"Task: {task.title}\nDue: {task.due_date}\n\n{task.description or ''}"
-            if send_email(recipient, subject, body):
-                task.notified_1day = True
-                db.session.add(task)
-                try:
-                   socketio.emit('deadline_alert', {'title': task.title, 'due': str(task.due_date), 'when': '1 day'})
-
-                except Exception as e:
-                    print("[check_deadlines] socket emit failed:", e)
+                Task.due_date <= day_threshold,
+                or_(Task.notified_1day == False, Task.notified_1hour == False),
+                _has_recipient()
+            )
+        ).all()
+    except Exception as e:
+        log.error("[check_deadlines] DB query failed: %s", e)
+        rows = []
+
+    jobs = []
+    day_ids = set()
+    hour_ids = set()
+    for task in rows:
+        if task.due_date <= hour_threshold and not task.notified_1hour:
+            kind = 'hour'
+            subject = _HOUR_SUBJ(title=task.title)
+        elif not task.notified_1day:
+            kind = 'day'
+            subject = _DAY_SUBJ(title=task.title)
+        else:
+            continue
+
+        recipient = task.notify_email or DEFAULT_TO
+        if not recipient:
+            log.warning("[check_deadlines] no recipient for task %s, skipping", task.id)
+            continue
+        body = _REMINDER_BODY(title=task.title, due=task.due_date, desc=task.description or '')
+        jobs.append({'to_address': recipient, 'subject': subject, 'body': body,
+                     'task_id': task.id, 'kind': kind})
+        (hour_ids if kind == 'hour' else day_ids).add(task.id)
+
+    if not jobs:
+        return
+
+    # a reminder already in the outbox (its flag was reset) is only flagged
+    # again; inserting it would trip ux_email_job_task_kind for the whole batch
+    try:
+        existing = set(db.session.execute(
+            select(EmailJob.task_id, EmailJob.kind)
+            .where(EmailJob.task_id.in_(day_ids | hour_ids))
+        ).tuples())
+    except Exception as e:
+        log.error("[check_deadlines] DB query (outbox) failed: %s", e)
+        return
+    jobs = [job for job in jobs if (job['task_id'], job['kind']) not in existing]
 
-        # 1-hour reminders
+    # outbox rows and notified flags go in one transaction: a reminder is
+    # either queued and flagged, or neither
+    try:
+        if jobs:
+            db.session.execute(insert(EmailJob), jobs)
+        _mark_notified(day_ids, hour_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.warning("[check_deadlines] queueing reminders failed (%s), retrying one by one", e)
+        _queue_reminders_one_by_one(jobs)
+    wake_mail_worker()
+
+def _queue_reminders_one_by_one(jobs):
+    """Fallback for a failed batch INSERT, so one bad row can't hold up the rest."""
+    for job in jobs:
+        ids = {job['task_id']}
+        day, hour = (set(), ids) if job['kind'] == 'hour' else (ids, set())
         try:
-            tasks_hour = Task.query.filter(
-                Task.status == 'Pending',
-                Task.due_date <= hour_threshold,
-                Task.due_date > now,
-                Task.notified_1hour == False
-            ).all()
+            db.session.execute(insert(EmailJob), [job])
+            _mark_notified(day, hour)
+            db.session.commit()
+            continue
+        except Exception:
+            db.session.rollback()
+            log.exception("[check_deadlines] dropping %s reminder for task %s",
+                          job['kind'], job['task_id'])
+        # flag it anyway: a row that can't be stored would otherwise be
+        # retried (and fail) on every run
+        try:
+            _mark_notified(day, hour)
+            db.session.commit()
         except Exception as e:
-            print("[check_deadlines] DB query (hour) failed:", e)
-            tasks_hour = []
-
-        for task in tasks_hour:
-            recipient = task.notify_recipient()
-            if not recipient:
-                print(f"[check_deadlines] no recipient for task {task.id}, skipping")
+            db.session.rollback()
+            log.error("[check_deadlines] flagging task %s failed: %s", job['task_id'], e)
+
+# check_deadlines is not polled; _deadline_loop (a green thread, like the mail
+# worker) sleeps until the next moment a task crosses its 1-day or 1-hour mark.
+# _next_check is that moment, None when there is nothing to remind about.
+_next_check = None
+# tokens put here make _deadline_loop re-read _next_check (set by _reschedule)
+_deadline_wakeup = Queue()
+_deadline_loop_started = False
+# longest single sleep: the timeout is computed from the naive local clock, so
+# re-read _next_check at least this often in case of a DST change / NTP step
+DEADLINE_MAX_SLEEP = 3600
+# if a crossing is still in the past right after a run (reminders could not be
+# queued, or the DB was unreachable) look again after this long instead of
+# firing back-to-back
+RESCHEDULE_RETRY = timedelta(minutes=1)
+
+def _reschedule(after_run=False):
+    """Schedule check_deadlines for the next 1-day / 1-hour threshold crossing.
+
+    A crossing already in the past runs right away, unless we are just back
+    from check_deadlines (after_run) and it evidently could not be handled.
+    """
+    global _next_check
+    with app.app_context():
+        now = datetime.now()
+        # one round trip, each MIN answered from its partial index
+        try:
+            next_day_due, next_hour_due = db.session.execute(select(
+                select(func.min(Task.due_date))
+                .where(Task.status == 'Pending', Task.notified_1day == False,
+                       Task.due_date > now, _has_recipient())
+                .scalar_subquery(),
+                select(func.min(Task.due_date))
+                .where(Task.status == 'Pending', Task.notified_1hour == False,
+                       Task.due_date > now, _has_recipient())
+                .scalar_subquery(),
+            )).one()
+        except Exception as e:
+            log.error("[reschedule] DB query failed: %s", e)
+            next_fire = now + RESCHEDULE_RETRY
+        else:
+            candidates = []
+            if next_day_due is not None:
+                candidates.append(next_day_due - timedelta(days=1))
+            if next_hour_due is not None:
+                candidates.append(next_hour_due - timedelta(hours=1))
+            if not candidates:
+                # nothing to remind about; add_task reschedules when that changes
+                next_fire = None
+            else:
+                next_fire = min(candidates)
+                if next_fire <= now:
+                    next_fire = now + RESCHEDULE_RETRY if after_run else now
+
+    _next_check = next_fire
+    wake_deadline_loop()
+
+def wake_deadline_loop():
+    """Tell _deadline_loop _next_check changed (starting it on first use)."""
+    global _deadline_loop_started
+    if not _deadline_loop_started:
+        # started on first use so it also runs when app.py isn't __main__
+        # (e.g. `flask run`); a green thread under async_mode='eventlet'
+        _deadline_loop_started = True
+        socketio.start_background_task(_deadline_loop)
+    _deadline_wakeup.put(None)
+
+@app.before_request
+def _start_deadline_scheduler():
+    # without __main__ nothing schedules existing tasks; do it on the first request
+    if not _deadline_loop_started:
+        _reschedule()
+
+def _deadline_loop():
+    """Run check_deadlines at _next_check, re-reading it whenever woken."""
+    while True:
+        # coalesce wake-ups, including the one check_deadlines itself sent
+        while not _deadline_wakeup.empty():
+            _deadline_wakeup.get_nowait()
+        if _next_check is None:
+            timeout = None           # sleep until add_task reschedules
+        else:
+            timeout = max(0, (_next_check - datetime.now()).total_seconds())
+            timeout = min(timeout, DEADLINE_MAX_SLEEP)
+        try:
+            _deadline_wakeup.get(timeout=timeout)
+            continue                 # rescheduled while sleeping
+        except Empty:
+            pass
+        if _next_check is None or _next_check > datetime.now():
+            continue                 # capped sleep ended early, not due yet
+        try:
+            check_deadlines()
+        except Exception:
+            log.exception("[check_deadlines] run failed")
+
+def _mark_notified(day_ids, hour_ids):
+    """Flip notified flags with one UPDATE per reminder kind (caller commits)."""
+    day_ids = day_ids - hour_ids     # the hour UPDATE sets notified_1day too
+    if hour_ids:
+        db.session.execute(
+            update(Task).where(Task.id.in_(hour_ids))
+            .values(notified_1day=True, notified_1hour=True)
+        )
+    if day_ids:
+        db.session.execute(
+            update(Task).where(Task.id.in_(day_ids)).values(notified_1day=True)
+        )
+
+# ------------- Mail worker -------------
+def _drain_outbox():
+    """Send one batch of due outbox jobs. Returns how many jobs were handled."""
+    now = datetime.now()
+    jobs = db.session.execute(
+        select(
+            EmailJob.id, EmailJob.to_address, EmailJob.subject, EmailJob.body,
+            EmailJob.kind, EmailJob.attempts, Task.title, Task.due_date
+        ).outerjoin(Task, Task.id == EmailJob.task_id).where(
+            EmailJob.sent_at.is_(None),
+            EmailJob.next_try_at <= now,
+            EmailJob.attempts < EMAIL_MAX_ATTEMPTS
+        ).order_by(EmailJob.id).limit(MAIL_BATCH_SIZE)
+        # lets several workers share the outbox (ignored on sqlite)
+        .with_for_update(skip_locked=True, of=EmailJob)
+    ).all()
+    if not jobs:
+        db.session.rollback()        # release the (empty) lock transaction
+        return 0
+
+    # No writes while sending: on sqlite a write would hold the database lock
+    # across SMTP I/O and block add_task / check_deadlines. All bookkeeping is
+    # done after the loop, right before the commit.
+    sent_ids = []
+    failed = []
+    alerts = []
+    with pooled_smtp() as mailer:
+        for job in jobs:
+            if job.id in _recent_sends:
+                # delivered earlier, only recording sent_at failed
+                log.debug("[Email] job %s already sent, not resending", job.id)
+                sent_ids.append(job.id)
                 continue
-            subject = f"Urgent: '{task.title}' is due in ~1 hour"
-            body = f"Task: {task.title}\nDue: {task.due_date}\n\n{task.description or ''}"
-            if send_email(recipient, subject, body):
-                task.notified_1hour = True
-                db.session.add(task)
-                try:
-                    socketio.emit('deadline_alert', {'title': task.title, 'due': str(task.due_date), 'when': '1 hour'}, broadcast=True)
-                except Exception as e:
-                    print("[check_deadlines] socket emit failed:", e)
+            try:
+                ok = mailer.send(job.to_address, job.subject, job.body)
+            except (OSError, smtplib.SMTPException) as e:
+                # server unreachable / login refused: the rest of the batch
+                # would fail the same way, leave it for the next round
+                log.error("[mail_worker] SMTP connection failed, stopping batch: %s", e)
+                failed.append(job)
+                break
+            if ok:
+                _recent_sends[job.id] = 1
+                sent_ids.append(job.id)
+                if job.kind is not None:
+                    alerts.append({'title': job.title, 'due': str(job.due_date),
+                                   'when': '1 hour' if job.kind == 'hour' else '1 day'})
+            else:
+                failed.append(job)
+
+    try:
+        for job in failed:
+            db.session.execute(
+                update(EmailJob).where(EmailJob.id == job.id).values(
+                    attempts=job.attempts + 1,
+                    next_try_at=now + EMAIL_RETRY_BASE * 2 ** job.attempts
+                )
+            )
+        if sent_ids:
+            db.session.execute(
+                update(EmailJob).where(EmailJob.id.in_(sent_ids))
+                .values(sent_at=datetime.now())
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
+    if alerts:
+        # one event for the whole batch instead of one per task
         try:
-            db.session.commit()
+            socketio.emit('deadline_alerts', {'items': alerts})
         except Exception as e:
-            db.session.rollback()
-            print("[check_deadlines] DB commit failed:", e)
+            log.error("[mail_worker] socket emit failed: %s", e)
+    # short of a full batch after a connection failure: the worker then waits
+    # for the next poll instead of retrying straight away
+    return len(sent_ids) + len(failed)
+
+def _mail_worker():
+    """Drain the outbox in batches, one SMTP session per batch."""
+    # log in before the first batch so it finds the session in the pool
+    _prefill_smtp_pool()
+    while True:
+        # coalesce wake-ups that arrived while we were busy
+        while not _mail_wakeup.empty():
+            _mail_wakeup.get_nowait()
+        try:
+            with app.app_context():
+                picked = _drain_outbox()
+        except Exception:
+            log.exception("[mail_worker] draining outbox failed")
+            picked = 0
+        if picked == MAIL_BATCH_SIZE:
+            continue                 # full batch, there is probably more
+        try:
+            _mail_wakeup.get(timeout=MAIL_POLL_SECONDS)
+        except Empty:
+            pass
 
 # ------------- SocketIO -------------
 @socketio.on('connect')
 def handle_connect():
-    print('Client connected')
+    log.debug('Client connected')
 
 # ------------- Run (safe startup) -------------
 if __name__ == '__main__':
@@ -221,14 +730,14 @@ if __name__ == '__main__':
         try:
             db.create_all()
         except Exception as e:
-            print("db.create_all() failed:", e)
+            log.error("db.create_all() failed: %s", e)
 
-    # schedule job after app is ready
-    try:
-        scheduler.add_job(func=check_deadlines, trigger='interval', minutes=1, id='check_deadlines_job')
-        scheduler.start()
-    except Exception as e:
-        print("Scheduler start failed:", e)
+    # start the mail worker (it logs in to SMTP first) and send whatever is
+    # still in the outbox from before the restart
+    wake_mail_worker()
+
+    # start the deadline scheduler after the app is ready
+    _reschedule()
 
     # run server (use 127.0.0.1 for local dev)
     socketio.run(app, debug=True, host='127.0.0.1', port=5000)